@@ -61,13 +61,17 @@ class iff_file:
         self.data = chunk()
         self.filename = filename
 
-    def load(self):
-        in_file = Path(self.filename)
-        
-        with in_file.open(mode="rb") as in_fh:
-            errval = self.data.parse(in_fh)
-            if errval != None:
-                print(errval)
+    def load(self, file_data: bytes|None=None):
+        """ Reads the chunk list, from file_data if the file is already in memory """
+        if file_data != None:
+            errval = self.data.parse(io.BytesIO(file_data))
+        else:
+            in_file = Path(self.filename)
+            
+            with in_file.open(mode="rb") as in_fh:
+                errval = self.data.parse(in_fh)
+        if errval != None:
+            print(errval)
 
     def dump(self, outdirname=None):
         filepath = Path(self.filename)
@@ -2,7 +2,7 @@
 
 import tgrlib
 import argparse
-from PIL import Image
+import functools
 from pathlib import Path
 
 if __name__ == "__main__":
@@ -15,6 +15,8 @@ if __name__ == "__main__":
     parser.add_argument('-v', '--verbose', action='store_true', help='Enable debugging printouts')
     parser.add_argument('--no-align-frames', action='store_true', help='Disable frame alignment within image size')
     parser.add_argument('--single-frame', default=-1, type=int, help='Extract only the specified frame')
+    parser.add_argument('--profile', action='store_true', help='Profile the extraction and print the functions it spent the most time in. Only the main thread is profiled, so PNG compression shows as waiting on saves')
+    parser.add_argument('--compress-level', choices=range(0,10), default=1, type=int, help='PNG compression level for extracted frames, from 0 (none) to 9 (smallest). Defaults to 1 (fastest compression)')
     args = parser.parse_args()
     
     image_path = args.image_path
@@ -29,44 +31,12 @@ if __name__ == "__main__":
 
     Path(image_name).mkdir(exist_ok=True)
 
-    frame_index = 0
-    pixel_format = "RGBA"
-
-    for frame_index, frame in enumerate(imagefile.frames):
-        if args.single_frame != -1 and args.single_frame != frame_index:
-            continue
-    #print(imagefile.framecount)
-    # frame = imagefile.frames[frame_index]
-
-        print(frame_index, frame.size)
-        if args.no_align_frames:
-            image = Image.new(pixel_format, frame.size)
-        else:
-            image = Image.new(pixel_format, imagefile.size)
-            fram_img = Image.new(pixel_format, frame.size)
-        imagedata = b""
-        with open(image_path, "rb") as in_fh:
-            for idx in range(len(frame.lines)):
-                rawline = imagefile.extractLine(in_fh, frame_index=frame_index, line_index=idx, increment=0, color=player_color)
-                #print(f"{idx+1:3d}: 0x{frame.lines[idx].offset:06x}, {len(rawline)}")
-                if len(rawline) < frame.size[0]:
-                    rawline += [tgrlib.transparency for _ in range(frame.size[0] - len(rawline))]
-                #while len(rawline) < frame.size[0]:
-                #    rawline.append(tgrlib.Pixel(0, 0, 0))
-                if len(rawline) > frame.size[0]:
-                    rawline = rawline[0:frame.size[0]]
-                imagedata += b"".join([elem.pack_to_bin(pixel_format) for elem in rawline])
-                #print(len(imagedata))
-        target_len = (frame.size[0] * frame.size[1]) * (3 if format == "RGB" else 4)
-        if len(imagedata) < target_len:
-            imagedata += bytes([0x00 for _ in range(target_len - len(imagedata))])
-        if args.no_align_frames:
-            image.frombytes(imagedata)
-        else:
-            fram_img.frombytes(imagedata)
-            offset = imagefile.frameoffsets[frame_index][0]
-            image.paste(fram_img, offset)
-        image.save(f"{image_name}/fram_{frame_index:04d}.png")
+    extract = functools.partial(imagefile.extractFrames, image_name, color=player_color, align=not args.no_align_frames,
+                                compress_level=args.compress_level, single_frame=args.single_frame)
+    if args.profile:
+        tgrlib.run_profiled(extract)
+    else:
+        extract()
     imagefile.write_config()
 
         #image.save(f"{image_name}.png")
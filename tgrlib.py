@@ -1,12 +1,15 @@
 #!/usr/bin/python
 
+import cProfile
 import ifflib
 import struct
 import io
 import re
 import sys
 import typing
+import pstats
 import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
 from pathlib import Path
 from PIL import Image
@@ -25,8 +28,44 @@ except Exception:
 verbose = False
 
 frame_number_re = re.compile(r"fram_(\d{1,4})")
+anim_number_re = re.compile(r"Animation(\d{1,1})")
+# One player colour entry, e.g. "Color_1_shade_1 = 43,2,2"
+player_color_re = re.compile(r"^[ \t]*color_(\d{1,2})_shade_(\d{1,2})[ \t]*=[ \t]*(\d{1,3}),(\d{1,3}),(\d{1,3})", re.IGNORECASE | re.MULTILINE)
 
-max_alpha = lambda p: Pixel(*(p.values()[:3]))
+rgb_struct = struct.Struct("BBB")
+rgba_struct = struct.Struct("BBBB")
+half_word_struct = struct.Struct("<H")
+# TGR header fields
+header_struct = struct.Struct("IHBx")
+index_mode_struct = struct.Struct("xBBx")
+point_struct = struct.Struct("HH")
+box_struct = struct.Struct("HHHH")
+frame_entry_struct = struct.Struct("HHHHI")
+animation_struct = struct.Struct("HHH")
+# The frame entry above as a numpy dtype, for packing all of them at once
+frame_entry_dtype = np.dtype([('box', '<u2', 4), ('offset', '<u4')])
+# Encoded line headers, keyed by whether the line length and pixel count need 15 bits
+line_header_structs = {(long_length, long_count): struct.Struct('>' + ('H' if long_length else 'B') + 'B' + ('H' if long_count else 'B'))
+                       for long_length in (False, True) for long_count in (False, True)}
+# A literal run of up to 31 direct colour pixels
+literal_run_structs = [struct.Struct(f"<{count}H") for count in range(32)]
+# Runs written with a colour, and with an alpha level then a colour, after the header
+color_run_struct = struct.Struct("<BH")
+translucent_run_struct = struct.Struct("<BBH")
+# A translucent player colour pixel, the header then the rest of the shade and alpha
+player_translucent_struct = struct.Struct("BB")
+# Name and big endian length at the start of each IFF chunk
+chunk_header_struct = struct.Struct(">4sI")
+
+# The top 3 bits of a run's first byte give its type, the low 5 usually its length
+transparent_run_header = 0b000 << 5
+solid_run_header = 0b001 << 5
+literal_run_header = 0b010 << 5
+translucent_run_header = 0b011 << 5
+translucent_pixel_header = 0b100 << 5
+shadow_run_header = 0b101 << 5
+player_pixel_header = 0b110 << 5
+player_translucent_header = 0b111 << 5
 
 def resource_path(relative_path):
     """ Get absolute path to resource, works for dev and for PyInstaller """
@@ -38,16 +77,25 @@ def resource_path(relative_path):
     #print(f'returning {base_path / relative_path}')
     return (base_path / relative_path).resolve()
 
-def read_line_length(in_fh: io.BufferedReader):
-    rawlen = in_fh.read(2)
-    if len(rawlen) < 2:
-        return 0
-    if rawlen[0] & 0x80 != 0:
-        (length,) = struct.unpack(">H", rawlen)
-        return length & 0x7fff
+def run_profiled(func, *args, **kwargs):
+    """
+    Calls func under cProfile, then prints the 20 functions it spent the most time in.
+    Only the calling thread is profiled, so PNGs saved on extractFrames' thread pool
+    show up as time waiting on the saves rather than as compression
+    """
+    profiler = cProfile.Profile()
+    result = profiler.runcall(func, *args, **kwargs)
+    pstats.Stats(profiler).sort_stats(pstats.SortKey.TIME).print_stats(20)
+    return result
+
+def read_line_length(data: bytes, offset: int):
+    """ Returns the length stored at offset and the offset following it """
+    if len(data) - offset < 2:
+        return (0, min(offset + 2, len(data)))
+    if data[offset] & 0x80 != 0:
+        return (((data[offset] & 0x7f) << 8) | data[offset + 1], offset + 2)
     else:
-        in_fh.seek(-1, 1)
-        return rawlen[0]
+        return (data[offset], offset + 1)
 
 def get_sprite_line_info(in_fh: io.BufferedReader):
     data = in_fh.read(3)
@@ -57,12 +105,7 @@ def get_sprite_line_info(in_fh: io.BufferedReader):
             "start": data[1],
             "pixel_length": data[2]}
 
-def getRunData(byte):
-    flag = byte >> 5
-    length = byte & 31
-    return (flag, length)
-
-@dataclass
+@dataclass(slots=True)
 class Pixel:
     """Class for managing pixel values in different formats"""
     red: int
@@ -72,20 +115,10 @@ class Pixel:
 
     @classmethod
     def from_int(cls, half_word: int):
-        # Shift values move each colour channel to the right
-        # place value.
-        # Bitwise AND masks off the unwanted bits to leave
-        # only the desired channel.
-        
-        blue = round((half_word & 0b11111) / 31 * 255)
-        green = round(((half_word >> 5) & 0b111111) / 63 * 255)
-        red = round(((half_word >> 11) & 0b11111) / 31 * 255)
-
+        # Channels are expanded from RGB565 by the same table the decoder uses
+        (red, green, blue, _) = rgb565_rgba[half_word]
         return cls(red, green, blue)
     
-    def copy(self):
-        return Pixel(self.red, self.green, self.blue, self.alpha)
-    
     def to_int(self):
         r5 = round(self.red / 255 * 31)
         g6 = round(self.green / 255 * 63)
@@ -97,12 +130,15 @@ class Pixel:
     def values(self):
         return (self.red, self.green, self.blue, self.alpha)
 
+    def to_u32(self):
+        return int.from_bytes(self.pack_to_bin("RGBA"), 'little')
+
     def pack_to_bin(self, format: str ="RGB") -> bytes:
         match format:
             case "RGB":
-                return struct.pack("BBB", self.red, self.green, self.blue)
+                return rgb_struct.pack(self.red, self.green, self.blue)
             case "RGBA":
-                return struct.pack("BBBB", self.red, self.green, self.blue, self.alpha)
+                return rgba_struct.pack(self.red, self.green, self.blue, self.alpha)
             case _:
                 raise Exception("Invalid pixel format specifier")
 
@@ -110,68 +146,147 @@ shadow = Pixel(0, 0, 0, 0x80)
 transparency = Pixel(0x00, 0x00, 0x00, 0x00)
 
 def load_player_colors(filename: str = "data/COLORS.INI"):
-    c_file = ConfigParser()
-    c_file.read(resource_path(filename))
+    # Every entry is found in a single pass over the file
+    entries = player_color_re.findall(resource_path(filename).read_text())
     player_cols = {}
-    c_name_re = re.compile(r"color_(\d{1,2})_shade_(\d{1,2})")
-    c_value_re = re.compile(r"\W*(\d{1,3}),(\d{1,3}),(\d{1,3})")
-    for color in c_file['PlayerColors']:
-        name_match = c_name_re.match(color)
-        value_match = c_value_re.match(c_file['PlayerColors'][color])
-        if name_match and value_match:
-            player_num = int(name_match.group(1))
-            shade_num = int(name_match.group(2))
-            color = value_match.group(1,2,3)
-            i_color = tuple(int(c) for c in color)
-            if player_num not in player_cols.keys():
-                player_cols[player_num] = {shade_num: Pixel(*i_color)}
-            else:
-                player_cols[player_num][shade_num] = Pixel(*i_color)
+    for (player_num, shade_num, *i_color) in entries:
+        player_cols.setdefault(int(player_num), {})[int(shade_num)] = Pixel(*map(int, i_color))
     return player_cols
 
 player_cols = load_player_colors()
+# Packed RGBA bytes for each player colour shade, used when decoding
+player_rgba = {c: {s: bytes(p.values()) for s, p in shades.items()} for c, shades in player_cols.items()}
+# RGBA bytes for the pair of player colour pixels packed into each byte of a nibble run
+player_pair_rgba = {c: [shades[((b >> 3) & 0b11111) | 0b1] + shades[((b << 1) & 0b11111) | 0b1] for b in range(256)]
+                    for c, shades in player_rgba.items()}
+transparent_rgba = bytes(transparency.values())
+shadow_rgba = bytes(shadow.values())
+# The same pixels packed into little endian ints, as compared when encoding
+transparent_u32 = int.from_bytes(transparent_rgba, 'little')
+shadow_u32 = int.from_bytes(shadow_rgba, 'little')
+opaque_u32 = 0xff000000
+# Shade number for each player colour pixel, keyed by the packed opaque pixel.
+# Built in reverse so where two shades share a colour the first one wins
+player_shades = {c: {p.to_u32(): s for s, p in reversed(shades.items())} for c, shades in player_cols.items()}
+# A translucent player colour pixel is written as 0b111 0b111 and the low 2 bits of its shade,
+# then the high 3 bits of the shade above a 5 bit alpha. Both parts are looked up by shade
+player_translucent_headers = [player_translucent_header + (0b111 << 2) + (shade & 0b11) for shade in range(32)]
+player_translucent_bodies = [(shade & 0b11100) << 3 for shade in range(32)]
 
 def packPixel(value=(0,0,0), alpha=False):
     if len(value) < 3:
         raise ValueError("Not enough pixel data")
     if alpha:
         if len(value) == 3:
-            return struct.pack("BBBB", value[0], value[1], value[2], 0xff)
-        return struct.pack("BBBB", value[0], value[1], value[2], value[3])
-    return struct.pack("BBB", value[0], value[1], value[2])
-
-def decodePixel(half_word: int):
-    # Shift values move each colour channel to the right
-    # place value.
-    # Bitwise AND masks off the unwanted bits to leave
-    # only the desired channel.
-    blue = round((half_word & 0b11111) / 31 * 255)
-    green = round(((half_word >> 5) & 0b111111) / 63 * 255)
-    red = round(((half_word >> 11) & 0b11111) / 31 * 255)
-    return Pixel(red, green, blue)
+            return rgba_struct.pack(value[0], value[1], value[2], 0xff)
+        return rgba_struct.pack(value[0], value[1], value[2], value[3])
+    return rgb_struct.pack(value[0], value[1], value[2])
+
+# Expand 5 and 6 bit channels to 8 bits, rounding to the nearest level
+expand5 = np.round(np.arange(32) / 31 * 255).astype(np.uint8)
+expand6 = np.round(np.arange(64) / 63 * 255).astype(np.uint8)
+
+def rgb565_to_rgba(half_words: np.ndarray):
+    """ Converts an array of RGB565 values to an (N, 4) uint8 array of opaque RGBA pixels """
+    rgba = np.full((len(half_words), 4), 0xff, dtype=np.uint8)
+    rgba[:, 0] = expand5[(half_words >> 11) & 0b11111]
+    rgba[:, 1] = expand6[(half_words >> 5) & 0b111111]
+    rgba[:, 2] = expand5[half_words & 0b11111]
+    return rgba
+
+# Reduce 8 bit channels to 5 and 6 bits, rounding the same way Pixel.to_int does
+reduce5 = np.round(np.arange(256) / 255 * 31).astype(np.uint16)
+reduce6 = np.round(np.arange(256) / 255 * 63).astype(np.uint16)
+
+def rgba_to_rgb565(pixels: np.ndarray):
+    """ Converts an (..., 4) uint8 array of RGBA pixels to a little endian RGB565 array, dropping alpha """
+    return ((reduce5[pixels[..., 0]] << 11) | (reduce6[pixels[..., 1]] << 5) | reduce5[pixels[..., 2]]).astype('<u2')
+
+# 8 bit alpha for each 5 bit translucency level, and the level nearest each 8 bit alpha
+alpha_levels = expand5.tolist()
+alpha_to_level = reduce5.tolist()
+
+# Opaque RGBA bytes for every RGB565 value, so decoding a pixel is one lookup
+rgb565_rgba = [entry.tobytes() for entry in rgb565_to_rgba(np.arange(0x10000))]
+
+def precompute_runs(packed: np.ndarray, width: int):
+    """
+    Counts how many of the following pixels in its row match each pixel of a frame.
+    Takes the frame's packed pixels row after row, so each pixel is compared as one int
+    """
+    packed = packed.reshape(-1, width)
+    height = len(packed)
+    columns = np.arange(width - 1)
+    matches_next = packed[:, 1:] == packed[:, :-1]
+    # The nearest column at or right of each pixel whose next pixel differs
+    breaks = np.where(matches_next, width - 1, columns)
+    next_break = np.minimum.accumulate(breaks[:, ::-1], axis=1)[:, ::-1]
+    runs = np.zeros((height, width), dtype=np.int32)
+    runs[:, :-1] = next_break - columns
+    return runs
+
+def precompute_literal_runs(packed: np.ndarray, width: int, player_pixels=()):
+    """
+    Counts how many pixels, from each pixel of a frame on, can go in a literal run of at most 31.
+    Takes the frame's packed pixels row after row and any player colour pixels to leave out
+    """
+    # The last pixel of a row is compared with the first of the next, the last pixel
+    # of the frame with a value that can't match it
+    following = np.append(packed[1:], ~packed[-1:])
+    literal = (packed != following) & (packed >= opaque_u32)
+    if player_pixels:
+        literal &= ~np.isin(packed, np.fromiter(player_pixels, dtype=np.uint32))
+    literal = literal.reshape(-1, width)
+    columns = np.arange(width)
+    # The nearest column at or right of each pixel that ends the run
+    breaks = np.where(literal, width, columns)
+    next_break = np.minimum.accumulate(breaks[:, ::-1], axis=1)[:, ::-1]
+    literal_runs = np.minimum(next_break - columns, 31)
+    # The last pixel of a row is always written on its own
+    literal_runs[:, -1] = 1
+    return literal_runs
+
+def precompute_player_shades(packed: np.ndarray, width: int, shades: dict):
+    """
+    Finds the player colour shade of each pixel of a frame, or -1 for pixels that aren't one.
+    Takes the frame's packed pixels row after row and the shade of each opaque packed player colour
+    """
+    player_shade = np.full(len(packed), -1, dtype=np.int32)
+    if shades:
+        # Translucent pixels match the shade of their opaque colour
+        opaque = packed | opaque_u32
+        colors = np.fromiter(shades.keys(), dtype=np.uint32)
+        order = colors.argsort()
+        colors = colors[order]
+        shade_numbers = np.fromiter(shades.values(), dtype=np.int32)[order]
+        found = np.searchsorted(colors, opaque).clip(max=len(colors) - 1)
+        is_player = colors[found] == opaque
+        player_shade[is_player] = shade_numbers[found[is_player]]
+    return player_shade.reshape(-1, width)
 
 class Line:
-    def __init__(self, in_fh: io.BufferedReader, sprite=False):
+    def __init__(self, data: bytes, offset: int, sprite=False):
         _ = sprite
-        header_offset = in_fh.tell()
-        total_length = read_line_length(in_fh)
-        self.transparent_pixels = read_line_length(in_fh)
-        self.pixel_length = read_line_length(in_fh)
-        self.offset = in_fh.tell()
+        header_offset = offset
+        (total_length, offset) = read_line_length(data, offset)
+        (self.transparent_pixels, offset) = read_line_length(data, offset)
+        (self.pixel_length, offset) = read_line_length(data, offset)
+        self.offset = offset
         self.data_length = total_length - (self.offset - header_offset)
                 
 class Frame:
-    def __init__(self, size, in_fh: io.BufferedReader):
+    def __init__(self, size, data: bytes, offset: int):
         self.size = size
         self.lines = []
+        # Lines are stored back to back, so the headers are read in one forward pass
         while len(self.lines) < self.size[1]:
-            newline = Line(in_fh, False)
+            newline = Line(data, offset, False)
             #if newline.data_length == 0:
             #    continue
             self.lines.append(newline)
             #if len(self.lines) >= self.size[1]:
             #    break
-            in_fh.seek(newline.offset + newline.data_length)
+            offset = newline.offset + newline.data_length
 
 class tgrFile:
     """
@@ -225,7 +340,10 @@ class tgrFile:
     def load(self, config_path: str|None=None, no_crop=False):
         match self.read_from:
             case '.TGR':
-                self.iff.load()
+                # Read the file once, the chunk list and everything in it are parsed from memory by offset
+                with open(self.filename, "rb") as in_fh:
+                    self.file_data = in_fh.read()
+                self.iff.load(self.file_data)
                 if self.iff.data.formtype != "TGAR":
                     print(f"Error: invalid file type: {self.iff.data.formtype}")
                 self.read_header()
@@ -235,186 +353,270 @@ class tgrFile:
             case '.PNG':
                 self.read_config(config_path)
                 self.img_data = [[] for _ in range(len(self.imgs))]
+                self.runs = [[] for _ in range(len(self.imgs))]
+                self.packed_pixels = [[] for _ in range(len(self.imgs))]
+                self.rgb565 = [[] for _ in range(len(self.imgs))]
+                # Filled in per frame and player colour as frames are encoded
+                self.literal_runs = {}
+                self.shade_indices = {}
                 self.size = self.imgs[0].size
                 for index, img in enumerate(self.imgs):
                     if index in self.padding_frames:
                         self.framesizes.append([0, 0, 0xFFFF, 0xFFFF, 0xFFFF, 0xFFFF])
                     else:
+                        # Encode from 4 byte RGBA pixels whatever mode the PNG was saved in
+                        if img.mode != 'RGBA':
+                            img = img.convert('RGBA')
                         if img.size != self.size:
                             raise ValueError(f"Frame:{index} size:{img.size} doesn't match Frame:0 size:{self.size}")
+                        img_array = np.asarray(img)
                         if not no_crop:
-                            # from https://stackoverflow.com/a/67677468
-                            img_array = np.array(img)
-                            # Find indices of non-transparent pixels (indices where alpha channel value is above zero).
-                            idx = np.where(img_array[:, :, 3] > 0)
-                            # Get minimum and maximum index in both axes (top left corner and bottom right corner)
-                            x0, y0, x1, y1 = idx[1].min(), idx[0].min(), idx[1].max(), idx[0].max()
-                            # Crop rectangle and convert to Image
-                            img = Image.fromarray(img_array[y0:y1+1, x0:x1+1, :])
+                            # Find the rows and columns holding non-transparent pixels (alpha channel value above zero)
+                            visible = img_array[:, :, 3] > 0
+                            rows = visible.any(axis=1)
+                            cols = visible.any(axis=0)
+                            if not rows.any():
+                                raise ValueError(f"Frame:{index} has no visible pixels to crop to")
+                            # The first and last of each give the top left and bottom right corners
+                            y0, y1 = rows.argmax(), len(rows) - 1 - rows[::-1].argmax()
+                            x0, x1 = cols.argmax(), len(cols) - 1 - cols[::-1].argmax()
+                            # Crop rectangle
+                            img_array = img_array[y0:y1+1, x0:x1+1, :]
                             self.framesizes.append([x1-x0+1, y1-y0+1, x0, y0, x1, y1])  # +1 includes both endpoints
                         else:
                             self.framesizes.append([img.size[0], img.size[1], 0, 0, img.size[0]-1, img.size[1]-1])
-                        self.img_data[index] = img.getdata()
+                        # Frames are kept as (H, W, 4) arrays, with every pixel also packed into
+                        # a little endian uint32, row after row
+                        self.img_data[index] = img_array
+                        self.packed_pixels[index] = np.ascontiguousarray(img_array).view('<u4').reshape(-1)
+                        # and as the RGB565 value it's written out as
+                        self.rgb565[index] = rgba_to_rgb565(img_array)
+                        # The length of the matching run following each pixel
+                        self.runs[index] = precompute_runs(self.packed_pixels[index], img_array.shape[1])
                     
 
     def read_header(self):
-        with open(self.filename, "rb") as in_fh:
-            in_fh.seek(self.iff.data.children[0].data_offset)
-            (self.version,
-             self.framecount,
-             self.bits_per_px) = struct.unpack("IHBx", in_fh.read(8))
-            (index_mode,
-             self.offset_flag) = struct.unpack("xBBx", in_fh.read(4))
-            self.size = struct.unpack("HH", in_fh.read(4))
-            self.hotspot = struct.unpack("HH", in_fh.read(4))
-            print(f'Image size: {self.size}')
-            
-            #print(self.offset_flag)
-            self.indexed_colour = index_mode & 0x7f == 0x1a
-            self.bounding_box = [*struct.unpack('HHHH',in_fh.read(8))]
-            in_fh.seek(12, 1)
-            #if self.indexed_colour:
-            #    in_fh.seek(12, 1)
-            for _ in range(self.framecount):
-                (ulx, uly, lrx, lry, offset) = struct.unpack("HHHHI", in_fh.read(12))
-                # Skip empty frames (offset will be zero)
-                if offset == 0:
-                    self.framesizes.append((0, 0, 0))
-                    self.frameoffsets.append(((0, 0), (0, 0)))
-                    print(f'Frame {_} is a padding frame. Leave frame as-is to avoid packing errors')
-                else:
-                    self.framesizes.append((1+lrx-ulx, 1+lry-uly, offset))
-                    self.frameoffsets.append(((ulx, uly), (lrx, lry)))
-            
-            self.anim_count = struct.unpack('H',in_fh.read(2))[0]
-            self.animations = []
-            for _ in range(self.anim_count):
-                #(start_frame, frame_count, frame_rate) = struct.unpack('HHH', in_fh.read(6))
-                self.animations.append([*struct.unpack('HHH', in_fh.read(6))])
+        data = self.file_data
+        offset = self.iff.data.children[0].data_offset
+        (self.version,
+         self.framecount,
+         self.bits_per_px) = header_struct.unpack_from(data, offset)
+        offset += header_struct.size
+        (index_mode,
+         self.offset_flag) = index_mode_struct.unpack_from(data, offset)
+        offset += index_mode_struct.size
+        self.size = point_struct.unpack_from(data, offset)
+        offset += point_struct.size
+        self.hotspot = point_struct.unpack_from(data, offset)
+        offset += point_struct.size
+        print(f'Image size: {self.size}')
+        
+        #print(self.offset_flag)
+        self.indexed_colour = index_mode & 0x7f == 0x1a
+        self.bounding_box = [*box_struct.unpack_from(data, offset)]
+        offset += box_struct.size + 12
+        #if self.indexed_colour:
+        #    offset += 12
+        # The frame table is unpacked entry by entry
+        frame_table = data[offset:offset + frame_entry_struct.size * self.framecount]
+        offset += len(frame_table)
+        for frame_number, (ulx, uly, lrx, lry, frame_offset) in enumerate(frame_entry_struct.iter_unpack(frame_table)):
+            # Skip empty frames (offset will be zero)
+            if frame_offset == 0:
+                self.framesizes.append((0, 0, 0))
+                self.frameoffsets.append(((0, 0), (0, 0)))
+                print(f'Frame {frame_number} is a padding frame. Leave frame as-is to avoid packing errors')
+            else:
+                self.framesizes.append((1+lrx-ulx, 1+lry-uly, frame_offset))
+                self.frameoffsets.append(((ulx, uly), (lrx, lry)))
+        
+        (self.anim_count,) = half_word_struct.unpack_from(data, offset)
+        offset += half_word_struct.size
+        #(start_frame, frame_count, frame_rate)
+        animation_table = data[offset:offset + animation_struct.size * self.anim_count]
+        self.animations = [[*animation] for animation in animation_struct.iter_unpack(animation_table)]
                 
         #print(len(self.framesizes))
 
     def load_palette(self):
         palt = self.iff.data.children[1]
-        self.palette = []
-        with open(self.filename, "rb") as in_fh:
-            in_fh.seek(palt.data_offset)
-            (count,) = struct.unpack("<H", in_fh.read(2))
-            print(f'Colors in Palette: {count}')
-            for _ in range(count):
-                raw_pixel = in_fh.read(2)
-                if len(raw_pixel) < 2:
-                    raise ValueError("Not enough image data")
-                (pixel,) = struct.unpack("H", raw_pixel)
-                self.palette.append(Pixel.from_int(pixel))
+        (count,) = half_word_struct.unpack_from(self.file_data, palt.data_offset)
+        print(f'Colors in Palette: {count}')
+        start = palt.data_offset + half_word_struct.size
+        raw_palette = self.file_data[start:start + count * 2]
+        if len(raw_palette) < count * 2:
+            raise ValueError("Not enough image data")
+        # Expanded to RGBA as an array, only to build the per entry bytes the decoder reads
+        self.palette = rgb565_to_rgba(np.frombuffer(raw_palette, dtype="<u2"))
+        self.palette_rgba = [entry.tobytes() for entry in self.palette]
 
     def get_frames(self):
-        with open(self.filename, "rb") as in_fh:
-            for child in self.framesizes:
-                in_fh.seek(child[2])
-                newframe = Frame((child[0], child[1]), in_fh)
-                self.frames.append(newframe)
+        for child in self.framesizes:
+            newframe = Frame((child[0], child[1]), self.file_data, child[2])
+            self.frames.append(newframe)
 
-    def get_next_pixel(self, in_fh: io.BufferedReader):
-        if self.indexed_colour:
-            (pixel_ix,) = struct.unpack("B", in_fh.read(1))
-            return self.palette[pixel_ix]
-        else:
-            (raw_pixel,) = struct.unpack("H", in_fh.read(2))
-            return Pixel.from_int(raw_pixel)
+    def extractLine(self, data: bytes, frame_index=0, line_index=0, increment=0, color=2, fx_error_fix=False):
+        return [Pixel(*p) for p in self.extractLineArray(data, frame_index, line_index, increment, color, fx_error_fix).tolist()]
 
-    def extractLine(self, fh: io.BufferedReader, frame_index=0, line_index=0, increment=0, color=2, fx_error_fix=False):
-        outbuf = []
+    def extractLineArray(self, data: bytes, frame_index=0, line_index=0, increment=0, color=2, fx_error_fix=False, pad=True):
+        """
+        Decodes a line to an (N, 4) uint8 array of RGBA pixels.
+        Reads by offset from a bytes-like view of the whole file, so lines
+        can be decoded in any order without any shared file position.
+        Short lines are padded out to the stored pixel length unless pad is
+        False, for callers writing into an already transparent buffer
+        """
         line_ix = 0
         pixel_ix = 0
         line = self.frames[frame_index].lines[line_index]
-        fh.seek(line.offset)
+        start = line.offset
+        data_length = line.data_length
+        px_bytes = self.bits_per_px // 8
+        # Pixel readers for the line's colour mode. Literal runs are converted
+        # with map and join, so the per pixel work happens inside builtins
+        if self.indexed_colour:
+            palette_rgba = self.palette_rgba
+            next_rgba = lambda data, offset: palette_rgba[data[offset]]
+            read_run = lambda data, offset, count: b''.join(map(palette_rgba.__getitem__, data[offset:offset + count]))
+        else:
+            unpack_half_word = half_word_struct.unpack_from
+            next_rgba = lambda data, offset: rgb565_rgba[unpack_half_word(data, offset)[0]]
+            # Runs only pass 31 pixels when lengths are incremented
+            run_struct = lambda count: literal_run_structs[count] if count < 32 else struct.Struct(f"<{count}H")
+            read_run = lambda data, offset, count: b''.join(map(rgb565_rgba.__getitem__, run_struct(count).unpack_from(data, offset)))
+        pcols = player_rgba[color]
+        pcol_pairs = player_pair_rgba[color]
         # print(f"Extracting line of length 0x{line.pixel_length:x}")
-        for _ in range(line.transparent_pixels):
-            outbuf.append(transparency)
+        # Pixels are packed RGBA bytes, so runs are filled by repetition
+        outbuf = bytearray(transparent_rgba * line.transparent_pixels)
         pixel_ix += line.transparent_pixels
         
-        while line_ix < line.data_length:# and pixel_ix < line.pixel_length:
-            run_header = fh.read(1)
+        while line_ix < data_length:# and pixel_ix < line.pixel_length:
+            run_header = data[start + line_ix]
             line_ix += 1
-            (flag, run_length) = getRunData(run_header[0])
+            # The top 3 bits are the run type, the low 5 bits its length
+            flag = run_header >> 5
+            run_length = run_header & 31
             
             if fx_error_fix:
-                if run_header[0] in (0x7F, 0xFD):
-                    outbuf.append(Pixel(255, 0, 255, 0))
+                if run_header in (0x7F, 0xFD):
+                    outbuf += b'\xff\x00\xff\x00'
                     pixel_ix += 1
                     continue
                     
             match flag:
                 case 0b000:
-                    outbuf += [transparency for _ in range(run_length + increment)]
+                    outbuf += transparent_rgba * (run_length + increment)
                 case 0b001:
-                    pixel = self.get_next_pixel(fh)
-                    outbuf += [pixel.copy() for _ in range(run_length+increment)]
+                    outbuf += next_rgba(data, start + line_ix) * (run_length+increment)
                     pixel_ix += run_length+increment
-                    line_ix += self.bits_per_px // 8
+                    line_ix += px_bytes
                 case 0b010:
-                    for _ in range(run_length+increment):
-                        outbuf.append(self.get_next_pixel(fh))
-                        line_ix += self.bits_per_px // 8
-                        pixel_ix += 1
+                    outbuf += read_run(data, start + line_ix, run_length+increment)
+                    line_ix += px_bytes * (run_length+increment)
+                    pixel_ix += run_length+increment
                 case 0b011:
-                    alpha_raw = fh.read(1)[0] & 31
-                    alpha = round((alpha_raw / 31) * 255)
+                    alpha = alpha_levels[data[start + line_ix] & 31]
                     line_ix +=1
-                    pixel = self.get_next_pixel(fh)
-                    pixel.alpha = alpha
-                    outbuf += [pixel.copy() for _ in range(run_length+increment)]
+                    outbuf += (next_rgba(data, start + line_ix)[:3] + bytes((alpha,))) * (run_length+increment)
                     pixel_ix += run_length+increment
-                    line_ix += self.bits_per_px // 8
+                    line_ix += px_bytes
                 case 0b100:
-                    pixel = self.get_next_pixel(fh)
-                    pixel.alpha = round(run_length / 31 * 255)
-                    outbuf.append(pixel.copy())
-                    line_ix += self.bits_per_px // 8
+                    outbuf += next_rgba(data, start + line_ix)[:3]
+                    outbuf.append(alpha_levels[run_length])
+                    line_ix += px_bytes
                     pixel_ix += 1
                 case 0b101:
                     #outbuf.append(Pixel(0xff, 0x00, 0xff))
-                    outbuf += [shadow for _ in range(run_length + increment)]
+                    outbuf += shadow_rgba * (run_length + increment)
                 case 0b110:
-                    #print(f"flag 6 at 0x{fh.tell()-1:08x}")
-                    outbuf.append(player_cols[color][run_length])
+                    #print(f"flag 6 at 0x{start+line_ix-1:08x}")
+                    outbuf += pcols[run_length]
                     pixel_ix += 1
                 case 0b111:
                     # check if run or single translucent
                     if verbose:
                         print(f'{line_index},{pixel_ix} ({line_ix}): reading 0b111 with run_length {run_length}')
                     if run_length > 27:
-                        byte = fh.read(1)[0]
+                        byte = data[start + line_ix]
                         alpha = byte & 31
                         color_index = (byte >> 3 & 0b11100) | (run_length & 3)
-                        # create new pixel object to avoid shallow copying
-                        pixel = Pixel(*player_cols[color][color_index].values())
-                        pixel.alpha = round(alpha / 31 * 255)
-                        outbuf.append(pixel.copy())
+                        outbuf += pcols[color_index][:3]
+                        outbuf.append(alpha_levels[alpha])
                         pixel_ix += 1
                         line_ix += 1
                     else:
                         read_length = (run_length + 1) // 2
-                        color_index = fh.read(read_length)
+                        color_index = data[start + line_ix:start + line_ix + read_length]
                         line_ix += read_length
                         
-                        for i, b in enumerate(color_index):
-                            # splits the byte into two 4bit sections, shifts left 1bit, and sets least sig to 1
-                            # then uses as index for player color value
-                            outbuf.append(player_cols[color][((b >> 3) & 0b11111) | 0b1])
-                            pixel_ix += 1
-                            # Don't append trailing null padding on odd run lengths
-                            if (run_length % 2 == 0) or (i < len(color_index) - 1):
-                                outbuf.append(player_cols[color][((b << 1) & 0b11111) | 0b1])
-                                pixel_ix += 1                    
+                        # splits each byte into two 4bit sections, shifts left 1bit, and sets least sig to 1
+                        # then uses as index for player color value
+                        run = b''.join(map(pcol_pairs.__getitem__, color_index))
+                        # Don't append trailing null padding on odd run lengths
+                        if run_length % 2 != 0 and run:
+                            run = run[:-4]
+                        outbuf += run
+                        pixel_ix += len(run) // 4
                 case _:
-                    print(f"{line_index:3d},{pixel_ix:3d}: Unsupported flag {flag} in datapoint 0x{run_header[0]:02x} at offset 0x{fh.tell()-1:08x}")
-        if len(outbuf) < line.pixel_length:
-            print(f"Appending {line.pixel_length - len(outbuf)} pixels to line {line_index}")
-            outbuf += [transparency for _ in range(line.pixel_length - len(outbuf))]
-        return outbuf
-    
+                    print(f"{line_index:3d},{pixel_ix:3d}: Unsupported flag {flag} in datapoint 0x{run_header:02x} at offset 0x{start+line_ix-1:08x}")
+        decoded = len(outbuf) // 4
+        if decoded < line.pixel_length:
+            print(f"Line {line_index} is {line.pixel_length - decoded} pixels short")
+            if pad:
+                outbuf += transparent_rgba * (line.pixel_length - decoded)
+        return np.frombuffer(outbuf, dtype=np.uint8).reshape(-1, 4)
+
+    def extractFrame(self, data: bytes|None=None, frame_index=0, color=2, fx_error_fix=False, align=False):
+        # Decodes from the copy of the file load() read into memory unless given other data
+        if data is None:
+            data = self.file_data
+        frame = self.frames[frame_index]
+        # Transparent pixels are all zero, so short lines need no padding
+        if align:
+            # Decode straight into the frame's place in a full size image
+            image = np.zeros((self.size[1], self.size[0], 4), dtype=np.uint8)
+            (x, y) = self.frameoffsets[frame_index][0]
+            out = image[y:y+frame.size[1], x:x+frame.size[0]]
+        else:
+            image = out = np.zeros((frame.size[1], frame.size[0], 4), dtype=np.uint8)
+        (height, width) = out.shape[:2]
+        extract = self.extractLineArray
+        for line_index in range(height):
+            row = extract(data, frame_index=frame_index, line_index=line_index, color=color, fx_error_fix=fx_error_fix, pad=False)
+            # Lines can decode wider than the frame, drop the excess
+            row = row[:width]
+            out[line_index, :len(row)] = row
+        return image
+
+    def extractFrames(self, output_dir: str|Path, color=2, fx_error_fix=False, align=True, compress_level=1, single_frame=-1, skip_padding=False):
+        """
+        Decodes frames and saves each one as output_dir/fram_NNNN.png.
+        Only single_frame is saved when it isn't -1. With skip_padding, blank
+        frames are added to padding_frames and saved as a 1x1 transparent
+        placeholder instead of being decoded
+        """
+        # Pillow releases the GIL while compressing, so frames are saved on a
+        # thread pool while the next frame decodes
+        saves = []
+        with ThreadPoolExecutor() as saver:
+            for frame_index, frame in enumerate(self.frames):
+                frame_path = f"{output_dir}/fram_{frame_index:04d}.png"
+                if skip_padding and frame.size == (0, 0,):
+                    print(f'padding frame {frame_index}')
+                    self.padding_frames.append(frame_index)
+                    image = Image.new('RGBA',(1,1),(0,0,0,0))
+                    image.save(frame_path, compress_level=compress_level)
+                    continue
+                if single_frame != -1 and single_frame != frame_index:
+                    continue
+                print(frame_index, frame.size)
+                image = Image.fromarray(self.extractFrame(frame_index=frame_index, color=color, fx_error_fix=fx_error_fix, align=align))
+                saves.append(saver.submit(image.save, frame_path, compress_level=compress_level))
+        # Raise any error a save hit
+        for save in saves:
+            save.result()
+
     def read_config(self, config_path: str|None=None):
         config = ConfigParser()
         if not config_path:
@@ -427,7 +629,6 @@ class tgrFile:
         
         self.animations = [(0, 0, 0, 0) for _ in range(6)]
         self.anim_count = 0
-        anim_number_re = re.compile(r"Animation(\d{1,1})")
         
         for k, v in config.items():
             m = anim_number_re.match(k)
@@ -496,44 +697,6 @@ class tgrFile:
         with open(config_path, 'w') as c_fh:
             config.write(c_fh)
 
-    def look_ahead(self, p: Pixel, frame_index, line_index, pixel_ix, matching=True, color=None, translucent=False):
-        collected = 0
-        if matching:
-            if verbose and frame_index == 0:
-                print(f'frame_index:{frame_index} (max:{len(self.img_data)}) pixel:{pixel_ix + collected + 1} (max:{self.framesizes[frame_index][0]}) total:{line_index*self.framesizes[frame_index][0] + pixel_ix + collected + 1} (max:{len(self.img_data[frame_index])}) size_data:{self.framesizes[frame_index]}')
-            while (pixel_ix + collected + 1 < self.framesizes[frame_index][0]):
-                next_pixel = Pixel(*self.img_data[frame_index][line_index*self.framesizes[frame_index][0] + pixel_ix + collected + 1])
-                if p != next_pixel:
-                    break
-                if color and max_alpha(next_pixel) in player_cols[color].values():
-                    break
-                collected += 1
-                if translucent and collected == 22:
-                    break
-                if collected == 30:
-                    break
-            return collected
-        else:
-            if pixel_ix == self.framesizes[frame_index][0] - 1:    # If last pixel in row:
-                return 1                        # Return 1 pixel, don't compare
-            while True:
-                if pixel_ix + collected >= self.framesizes[frame_index][0]:
-                    break
-                this_pixel = Pixel(*self.img_data[frame_index][line_index*self.framesizes[frame_index][0] + pixel_ix + collected])
-                next_pixel = Pixel(*self.img_data[frame_index][line_index*self.framesizes[frame_index][0] + pixel_ix + collected + 1])
-                if this_pixel == next_pixel or this_pixel.alpha != 255:
-                    break
-                if color and max_alpha(this_pixel) in player_cols[color].values():
-                    break
-                if verbose and frame_index == 0:
-                    print(f"\tLook_Ahead: pixel {this_pixel} at c:{pixel_ix + collected} doesn't match pixel {next_pixel} at c:{pixel_ix + collected + 1}")
-                collected += 1
-                if collected == 31:
-                    break
-            if verbose:
-                print(f'      Look_Ahead: collected {collected} individual pixels')
-            return collected
-    
     def encodeLineHeader(self, frame_index, line_index, outbuf, ct_pixels, offset=0):
         #print(outbuf)
         line_length = len(outbuf)
@@ -543,210 +706,253 @@ class tgrFile:
         assert offset <= 0xFF, f'f:{frame_index: >4} l:{line_index: >4} offset to first non-padding pixel exceeds 8 bit maximum'
         assert ct_pixels <= 0x7FFF, f'f:{frame_index: >4} l:{line_index: >4} pixel count {ct_pixels} exceeds 15 bit maximum'
         
-        if ct_pixels > 0x7F:
+        long_count = ct_pixels > 0x7F
+        if long_count:
             ct_pixels = ct_pixels | 0x8000
-            pfc = 'H'
             header_length += 1
-        else:
-            pfc = 'B'
         
-        if line_length + header_length > 0x7F:
+        long_length = line_length + header_length > 0x7F
+        if long_length:
             line_length = line_length | 0x8000
-            lfc = 'H'
             header_length += 1
-        else:
-            lfc = 'B'
         
-        return struct.pack('>'+lfc+'B'+pfc, line_length+header_length, offset, ct_pixels) + outbuf
+        return line_header_structs[(long_length, long_count)].pack(line_length+header_length, offset, ct_pixels) + outbuf
         
         
     def encodeLine(self, frame_index=0, line_index=0, color=None):
-        if verbose:
+        # Local copy of the debug switch for the pixel loop
+        debug = verbose
+        if debug:
             print(f"image size:{self.size}")
         pixel_ix = 0
         offset = 0      # Offset from edge of frame to first non-padding pixel
         ct_pixels = 0
         padding_complete = False
-        outbuf = b''
+        width = self.framesizes[frame_index][0]
+        # Run lengths are read from the frame's precomputed tables
+        runs = self.runs[frame_index][line_index].tolist()
+        # The colour list's shades are looked up once for both player colour aware tables
+        color_shades = player_shades[color] if color else {}
+        if (frame_index, color) not in self.literal_runs:
+            self.literal_runs[(frame_index, color)] = precompute_literal_runs(self.packed_pixels[frame_index], width, color_shades)
+        literal_runs = self.literal_runs[(frame_index, color)][line_index].tolist()
+        # Player colour pixels are found for the whole frame at once, with their shade
+        if (frame_index, color) not in self.shade_indices:
+            self.shade_indices[(frame_index, color)] = precompute_player_shades(self.packed_pixels[frame_index], width, color_shades)
+        shades = self.shade_indices[(frame_index, color)][line_index].tolist()
+        row = self.img_data[frame_index][line_index]
+        # Each pixel packed into one int, so the common checks are a single compare
+        packed_pixels = self.packed_pixels[frame_index][line_index*width:(line_index + 1)*width].tolist()
+        rgb565 = self.rgb565[frame_index][line_index]
+        bodies = rgb565.tolist()
+        # A row of one colour, other than a player colour, is written as runs of the longest
+        # length without going pixel by pixel
+        if runs[0] == width - 1 and shades[0] < 0:
+            packed = packed_pixels[0]
+            alpha = packed >> 24
+            body = bodies[0]
+            if packed == transparent_u32:
+                # Nothing but leading padding
+                return self.encodeLineHeader(frame_index, line_index, b'', 0, offset=width)
+            if packed == shadow_u32:
+                (full, rest) = divmod(width, 31)
+                outbuf = bytes([shadow_run_header + 31]) * full
+                if rest:
+                    outbuf += bytes([shadow_run_header + rest])
+            elif alpha < 255:
+                a = alpha_to_level[alpha]
+                (full, rest) = divmod(width, 23)
+                outbuf = translucent_run_struct.pack(translucent_run_header + 23, a, body) * full
+                if rest == 1:
+                    outbuf += color_run_struct.pack(translucent_pixel_header + a, body)
+                elif rest:
+                    outbuf += translucent_run_struct.pack(translucent_run_header + rest, a, body)
+            else:
+                (full, rest) = divmod(width, 31)
+                outbuf = color_run_struct.pack(solid_run_header + 31, body) * full
+                # A single pixel left over goes in a literal run, as it would below
+                if rest == 1:
+                    outbuf += color_run_struct.pack(literal_run_header + 1, body)
+                elif rest:
+                    outbuf += color_run_struct.pack(solid_run_header + rest, body)
+            return self.encodeLineHeader(frame_index, line_index, outbuf, width)
         
-        while pixel_ix < self.framesizes[frame_index][0]:
+        # Written in place into a buffer big enough for the whole line, a 3 byte run for every pixel,
+        # and trimmed to the out_ix bytes used at the end
+        outbuf = bytearray(3 * width)
+        out_ix = 0
+        
+        while pixel_ix < width:
             if frame_index == 0:
-                if verbose:
+                if debug:
                     print(f'TOP OF LOOP: pixel_ix:{pixel_ix}')
             
-            p = Pixel(*self.img_data[frame_index][line_index*self.framesizes[frame_index][0] + pixel_ix])
-            if verbose:
-                print(f'reading p:{p} at l:{line_index} c:{pixel_ix}')
+            # Alpha is the top byte of the packed pixel, so no Pixel is made per pixel
+            packed = packed_pixels[pixel_ix]
+            alpha = packed >> 24
+            if debug:
+                print(f'reading p:{row[pixel_ix]} at l:{line_index} c:{pixel_ix}')
                 
             # Allows for offset to collect more than 31 pixels, set true once first non-padding pixel is reached
-            if padding_complete == False and p != transparency:
+            if padding_complete == False and packed != transparent_u32:
                 padding_complete = True
                 
-            if p == transparency:        # Encode transparent pixels
-                if verbose:
+            if packed == transparent_u32:        # Encode transparent pixels
+                if debug:
                     print(f'  chose flag 0b000')
-                run_length = self.look_ahead(p, frame_index, line_index, pixel_ix) + 1
+                run_length = min(runs[pixel_ix], 30) + 1
                 # collect all leading padding
                 if not padding_complete:
                     offset += run_length
                     pixel_ix += run_length
                 # Don't write trailing padding
-                elif pixel_ix + run_length >= self.framesizes[frame_index][0]:
+                elif pixel_ix + run_length >= width:
                     break
                 else:
                     if run_length == 31:
-                        print(f'31 transparent pixels found, begining scan-ahead at l:{line_index} p:{pixel_ix}')
-                        collected = run_length
-                        while pixel_ix + collected < self.framesizes[frame_index][0] and (ct := self.look_ahead(p, frame_index, line_index, pixel_ix + collected) + 1) == 31:
-                            print(f'   read {ct} more, total is {collected}')
-                            collected += ct
-                        collected += ct  # ct won't have been added the final time
-                        if pixel_ix + collected >= self.framesizes[frame_index][0]:
+                        if debug:
+                            print(f'31 transparent pixels found, begining scan-ahead at l:{line_index} p:{pixel_ix}')
+                        # Don't write trailing padding, however long it is
+                        if pixel_ix + runs[pixel_ix] + 1 >= width:
                             break
                     
-                    flag = 0b000 << 5
-                    header = flag + (run_length & 0b11111)
-                    outbuf += struct.pack('<B', header)
+                    header = transparent_run_header + (run_length & 0b11111)
+                    outbuf[out_ix] = header
+                    out_ix += 1
                     pixel_ix += run_length
                     ct_pixels += run_length
-                    if verbose:
+                    if debug:
                         print(f'  packing header {header:02X}')
             
-                if verbose:
+                if debug:
                     print(f'  advanced to c:{pixel_ix}')
                 
-            elif p == shadow:
-                ct_shadow = self.look_ahead(p, frame_index, line_index, pixel_ix) + 1
-                flag = 0b101 << 5
-                header = flag + (ct_shadow & 0b11111)
-                outbuf += struct.pack('<B', header)
+            elif packed == shadow_u32:
+                ct_shadow = min(runs[pixel_ix], 30) + 1
+                header = shadow_run_header + (ct_shadow & 0b11111)
+                outbuf[out_ix] = header
+                out_ix += 1
                 pixel_ix += ct_shadow
                 ct_pixels += ct_shadow
             
-            # Set alpha to 255 for compare so translucent PP will still match
-            elif max_alpha(p) in player_cols[color].values():
+            # Player colour pixels, translucent ones having matched their opaque colour
+            elif shades[pixel_ix] >= 0:
+                color_index = shades[pixel_ix]
                 # encode translucent PP
-                if p.alpha < 255:
-                    flag = 0b111 << 5
-                    fixed_bits = 0b111 << 2
-                    color_index = list(player_cols[color].keys())[list(player_cols[color].values()).index(max_alpha(p))]
-                    # split color_index for packing
-                    ci_l = (color_index & 0b11)
-                    ci_h = (color_index & 0b11100) << 3
-                    a = p.to_int()[3] & 0b11111
-                    header = flag + fixed_bits + ci_l
-                    body = ci_h + a
-                    outbuf += struct.pack('<BB', header, body)
-                    print(f"  packing header {header:02X} and body {body:02X}")
+                if alpha < 255:
+                    a = alpha_to_level[alpha]
+                    # color_index is split between the header and body, only its low 5 bits fit
+                    header = player_translucent_headers[color_index & 0b11111]
+                    body = player_translucent_bodies[color_index & 0b11111] + a
+                    player_translucent_struct.pack_into(outbuf, out_ix, header, body)
+                    out_ix += 2
+                    if debug:
+                        print(f"  packing header {header:02X} and body {body:02X}")
                     pixel_ix += 1
                     ct_pixels += 1
                     
                     # encode opaque PP
                 else:
-                    if verbose:
+                    if debug:
                         if frame_index == 0:
-                            print(f'matched pixel {p} in color list {color}')
-                        printf('  chose flag 0b110')
-                    flag = 0b110 << 5
-                    color_index = list(player_cols[color].keys())[list(player_cols[color].values()).index(p)]
-                    header = flag + (color_index & 0b11111)
-                    outbuf += struct.pack('B', header)
+                            print(f'matched pixel {row[pixel_ix]} in color list {color}')
+                        print('  chose flag 0b110')
+                    header = player_pixel_header + (color_index & 0b11111)
+                    outbuf[out_ix] = header
+                    out_ix += 1
                     pixel_ix += 1
                     ct_pixels += 1
-                    if verbose and frame_index == 0:
-                        print(f'  packed {header:02X}, flag {flag}, index {color_index}')
+                    if debug and frame_index == 0:
+                        print(f'  packed {header:02X}, flag {player_pixel_header}, index {color_index}')
                 
-            elif p.alpha < 255:     #Encode translucent pixels                    
-                run_length = self.look_ahead(p, frame_index, line_index, pixel_ix, translucent=True) + 1
-                (r,g,b,a) = p.to_int()
+            elif alpha < 255:     #Encode translucent pixels                    
+                run_length = min(runs[pixel_ix], 22) + 1
+                a = alpha_to_level[alpha]
+                body = bodies[pixel_ix]
                 if run_length == 1:
-                    if verbose:
+                    if debug:
                         print(f'  chose flag 0b100')
-                    flag = 0b100 << 5
-                    header = flag + (a & 0b11111)
-                    body = (r << 11) + (g << 5) + b
-                    if verbose:
+                    header = translucent_pixel_header + (a & 0b11111)
+                    if debug:
                         print(f"  packing header {header:02X} and body {body:04X}")
-                    outbuf += struct.pack('<BH', header, body)
+                    color_run_struct.pack_into(outbuf, out_ix, header, body)
+                    out_ix += 3
                 else:
-                    if verbose:
+                    if debug:
                         print(f'  chose flag 0b011')
-                    flag = 0b011 << 5
-                    header = flag + (run_length & 0b11111)
-                    body = (r << 11) + (g << 5) + b
-                    outbuf += struct.pack('<BBH', header, a, body)
-                    if verbose:
+                    header = translucent_run_header + (run_length & 0b11111)
+                    translucent_run_struct.pack_into(outbuf, out_ix, header, a, body)
+                    out_ix += 4
+                    if debug:
                         print(f'  packing header {header:02X} alpha {a:02X} and body {body:04X}')
                 pixel_ix += run_length
                 ct_pixels += run_length
-                if verbose:
+                if debug:
                     print(f'  advanced to c:{pixel_ix}')
                     
             else:                   # Encode opaque pixels
-                matching = self.look_ahead(p, frame_index, line_index, pixel_ix, color=color)
+                # Player colour pixels were encoded above, so never start a run here
+                matching = min(runs[pixel_ix], 30)
                 if matching:
-                    if verbose:
+                    if debug:
                         print(f'  chose flag 0b001')
-                    flag = 0b001 << 5
                     run_length = matching + 1
-                    header = flag + (run_length & 0b11111)
-                    (r,g,b,a) = p.to_int()
-                    body = (r << 11) + (g << 5) + b
-                    outbuf += struct.pack('<BH', header, body)
+                    header = solid_run_header + (run_length & 0b11111)
+                    body = bodies[pixel_ix]
+                    color_run_struct.pack_into(outbuf, out_ix, header, body)
+                    out_ix += 3
                     pixel_ix += run_length
                     ct_pixels += run_length
-                    if verbose:
+                    if debug:
                         print(f'  packing header {header:02X} and body {body:04X}\n  advanced to c:{pixel_ix}')
                 
                 else:
-                    non_matching = self.look_ahead(p, frame_index, line_index, pixel_ix, matching=False, color=color)
+                    non_matching = literal_runs[pixel_ix]
                     if non_matching:
-                        if verbose:
+                        if debug:
                             print(f'  chose flag 0b010')
                         run_length = non_matching
-                        if verbose:
+                        if debug:
                             print(f'  found {run_length} unique pixels')
-                        flag = 0b010 << 5
-                        header = flag + (run_length & 0b11111)
-                        outbuf += struct.pack('<B', header)
-                        if verbose:
+                        header = literal_run_header + (run_length & 0b11111)
+                        outbuf[out_ix] = header
+                        out_ix += 1
+                        if debug:
                             print(f'  packing header {header:02X}')
-                        for i in range(0,run_length):
-                            cur_pix = Pixel(*self.img_data[frame_index][line_index*self.framesizes[frame_index][0] + pixel_ix + i])
-                            (r,g,b,a) = cur_pix.to_int()
-                            if verbose:
-                                print(f'    p:{cur_pix} r:{r} g:{g} b:{b} a:{a}')
-                            body = (r << 11) + (g << 5) + b
-                            outbuf += struct.pack('<H', body)
-                            if verbose:
-                                print(f'    packing body:{body:04X}')
+                        # The run's pixels are already RGB565, so they're copied out in one go
+                        outbuf[out_ix:out_ix + 2*run_length] = rgb565[pixel_ix:pixel_ix + run_length].tobytes()
+                        out_ix += 2*run_length
+                        if debug:
+                            for i in range(0,run_length):
+                                print(f'    p:{row[pixel_ix + i]} packing body:{bodies[pixel_ix + i]:04X}')
                         pixel_ix += run_length
                         ct_pixels += run_length
                     
                     else:
-                        print(f'f:{frame_index: >4} l:{line_index: >4} p:{pixel_ix} : could not pack {p}, defaulting to 0x0000')
-                        header = 0b01000001
-                        pixel = 0x0000
-                        outbuf += struct.pack('<BH', header, body)
+                        print(f'f:{frame_index: >4} l:{line_index: >4} p:{pixel_ix} : could not pack {row[pixel_ix]}, defaulting to 0x0000')
+                        # A literal run of one black pixel
+                        color_run_struct.pack_into(outbuf, out_ix, literal_run_header + 1, 0x0000)
+                        out_ix += 3
                         pixel_ix += 1
                         ct_pixels += 1
                         
-                if verbose:
+                if debug:
                         print(f'  advanced to c:{pixel_ix}')
         
+        del outbuf[out_ix:]
         return self.encodeLineHeader(frame_index, line_index, outbuf, ct_pixels, offset=offset)    
         
     
     def encodeFrame(self, frame_index=0, color=None):
-        outbuf = b''
-        for line_index in range(0,self.framesizes[frame_index][1]):
-            outbuf += self.encodeLine(frame_index=frame_index, line_index=line_index, color=color)
+        # Collect the encoded lines and join them once
+        outbuf = b''.join([self.encodeLine(frame_index=frame_index, line_index=line_index, color=color)
+                           for line_index in range(0,self.framesizes[frame_index][1])])
         
         # pad frame to 4-byte boundary
         if len(outbuf) % 4 != 0:
             outbuf += b'\x00' * (4 - (len(outbuf) % 4))
         
-        return struct.pack('>II', 0x4652414D, len(outbuf)) + outbuf
+        return chunk_header_struct.pack(b'FRAM', len(outbuf)) + outbuf
     
     def calcHotSpot(self):
         if self.hotspot != (0,0):
@@ -766,26 +972,22 @@ class tgrFile:
     def packFrameSizes(self, anim_buf: bytes):
         offset_to_fram = 12 + 8 + 40 + len(self.img_data)*12 + len(anim_buf) + 8
         # FORM + HEDR header + HEDR body + expected frame sizes + animations + FRAM header
-        outbuf = b''
-        for s, o in zip(self.framesizes, self.frameoffsets):
-            # make sure offset stays 0 for padding frames
-            if s[2] == 0xFFFF and o == 0:
-                o -= offset_to_fram
-            outbuf += struct.pack('4HI',
-                                 s[2],
-                                 s[3],
-                                 s[4],
-                                 s[5],
-                                 o + offset_to_fram
-             )
+        # Every frame's bounding box and offset are packed at once from a structured array
+        count = min(len(self.framesizes), len(self.frameoffsets))
+        entries = np.zeros(count, dtype=frame_entry_dtype)
+        entries['box'] = np.array([s[2:6] for s in self.framesizes[:count]]).reshape(-1, 4)
+        offsets = np.array(self.frameoffsets[:count], dtype=np.int64)
+        # make sure offset stays 0 for padding frames
+        padding = (entries['box'][:, 0] == 0xFFFF) & (offsets == 0)
+        entries['offset'] = np.where(padding, 0, offsets + offset_to_fram)
+        outbuf = entries.tobytes()
         if len(outbuf) != len(self.img_data)*12:
-            raise ValueError("Packed Frame Size {len(outbuf)} doesn't' matched expected size {len(self.img_data)*12}")
+            raise ValueError(f"Packed Frame Size {len(outbuf)} doesn't' matched expected size {len(self.img_data)*12}")
         return outbuf
     
     def packAnimations(self):
-        data = struct.pack('<H', self.anim_count)
-        for a in self.animations:
-            data += struct.pack('HHH', a[0], a[1], a[2])
+        data = half_word_struct.pack(self.anim_count)
+        data += b''.join([animation_struct.pack(a[0], a[1], a[2]) for a in self.animations])
         
         if self.anim_count % 2 == 0:
             data += b'\x00' * 2
@@ -851,7 +1053,7 @@ class tgrFile:
         hedr_buf += frame_sizes + animations
                
         #print(f'chunk_name:{chunk_name}:{type(chunk_name)}\nchunk_length:{chunk_length}:{type(chunk_length)}')
-        return struct.pack('>4sI', chunk_name, len(hedr_buf)) + hedr_buf + frame_buffer
+        return chunk_header_struct.pack(chunk_name, len(hedr_buf)) + hedr_buf + frame_buffer
         
     def encodeForm(self, file_buffer: bytes):
         chunk_name = b'FORM'
@@ -897,22 +1099,20 @@ class tgrFile:
             # dtype=int16 allows for negatives rather than overflow
             hsv_im_data = np.array(self.imgs[0].convert('HSV'),dtype='int16')
             mask_img = np.array(Image.open(resource_path('data/large-portrait-shadow-mask.png')))
-            # Shadow intensity 1 is represented with yellow pixels
-            mask_s1 = ((mask_img[:,:,:3] == [255,255,0]).all(axis=2)*(5*2.55)).astype('uint8')
-            # Shadow intensity 2 is represented with red pixels
-            mask_s2 = ((mask_img[:,:,:3] == [255,0,0]).all(axis=2)*(10*2.55)).astype('uint8')
-            # Shadow intensity 3 is represented with cyan pixels
-            mask_s3 = ((mask_img[:,:,:3] == [0,255,255]).all(axis=2)*(20*2.55)).astype('uint8')
-            # Shadow intensity 4 is represented with green pixels
-            mask_s4 = ((mask_img[:,:,:3] == [0,255,0]).all(axis=2)*(30*2.55)).astype('uint8')
-            # Shadow intensity 5 is represented with blue pixels
-            mask_s5 = ((mask_img[:,:,:3] == [0,0,255]).all(axis=2)*(40*2.55)).astype('uint8')
-            
-            full_mask = (mask_s1 + mask_s2 + mask_s3 + mask_s4 + mask_s5)
-            # Subtracts shadows from V channel
-            hsv_im_data[:,:,2] -= full_mask
+            # Pack each mask pixel's colour into one int so the whole mask is looked up at once
+            mask_key = (mask_img[:,:,0].astype('uint32') << 16) | (mask_img[:,:,1].astype('uint32') << 8) | mask_img[:,:,2]
+            # Shadow intensities 5 to 1 are represented with blue, green, cyan, red and yellow pixels,
+            # each darkening by the given percentage. Sorted by colour for searchsorted
+            shadow_colors = np.array([0x0000FF, 0x00FF00, 0x00FFFF, 0xFF0000, 0xFFFF00], dtype='uint32')
+            shadow_levels = (np.array([40, 30, 20, 10, 5])*2.55).astype('uint8')
+            shadow_ix = np.searchsorted(shadow_colors, mask_key).clip(max=len(shadow_colors) - 1)
+            # Pixels of any other colour aren't shadowed
+            full_mask = np.where(shadow_colors[shadow_ix] == mask_key, shadow_levels[shadow_ix], 0).astype('uint8')
+            # Subtracts shadows from V channel, in place through a view of it
+            value = hsv_im_data[:,:,2]
+            value -= full_mask
             # sets a minimum V of 6/255 ONLY for pixels in mask (true blacks elsewhere not affected)
-            hsv_im_data[:,:,2][full_mask.astype('?')] = hsv_im_data[:,:,2][full_mask.astype('?')].clip(min=6)
+            np.maximum(value, 6, out=value, where=full_mask > 0)
             self.imgs[0] = Image.fromarray(hsv_im_data.astype('uint8'),mode='HSV').convert('RGBA')
         return
     
@@ -4,7 +4,6 @@ import argparse
 import tgrlib
 import struct
 from pathlib import Path
-from PIL import Image
 
 def unpack(args: argparse.Namespace):
     image_path = args.source
@@ -22,50 +21,8 @@ def unpack(args: argparse.Namespace):
     print(image_name)
     Path(image_name).mkdir(exist_ok=True, parents=True)
 
-    frame_index = 0
-    pixel_format = "RGBA"
-    for frame_index, frame in enumerate(imagefile.frames):
-        
-        # Check for padding (blank) frames
-        if frame.size == (0, 0,):
-            print(f'padding frame {frame_index}')
-            imagefile.padding_frames.append(frame_index)
-            image = Image.new('RGBA',(1,1),(0,0,0,0))
-            image.save(f"{image_name}/fram_{frame_index:04d}.png")
-            continue            
-        
-        if args.single_frame != -1 and args.single_frame != frame_index:
-            continue
-    #print(imagefile.framecount)
-    # frame = imagefile.frames[frame_index]
-
-        print(frame_index, frame.size)
-        imagedata = b""
-        with open(image_path, "rb") as in_fh:
-            for idx in range(len(frame.lines)):
-                rawline = imagefile.extractLine(in_fh, frame_index=frame_index, line_index=idx, increment=0, color=player_color, fx_error_fix=args.fx_error_fix)
-                #print(f"{idx+1:3d}: 0x{frame.lines[idx].offset:06x}, {len(rawline)}")
-                if len(rawline) < frame.size[0]:
-                    rawline += [tgrlib.transparency for _ in range(frame.size[0] - len(rawline))]
-                #while len(rawline) < frame.size[0]:
-                #    rawline.append(tgrlib.Pixel(0, 0, 0))
-                if len(rawline) > frame.size[0]:
-                    rawline = rawline[0:frame.size[0]]
-                imagedata += b"".join([elem.pack_to_bin(pixel_format) for elem in rawline])
-                #print(len(imagedata))
-        target_len = (frame.size[0] * frame.size[1]) * (3 if format == "RGB" else 4)
-        if len(imagedata) < target_len:
-            imagedata += bytes([0x00 for _ in range(target_len - len(imagedata))])
-        if args.no_align_frames:
-            image = Image.new(pixel_format, frame.size)
-            image.frombytes(imagedata)
-        else:
-            image = Image.new(pixel_format, imagefile.size)
-            fram_img = Image.new(pixel_format, frame.size)
-            fram_img.frombytes(imagedata)
-            offset = imagefile.frameoffsets[frame_index][0]
-            image.paste(fram_img, offset)
-        image.save(f"{image_name}/fram_{frame_index:04d}.png")
+    imagefile.extractFrames(image_name, color=player_color, fx_error_fix=args.fx_error_fix, align=not args.no_align_frames,
+                            compress_level=args.compress_level, single_frame=args.single_frame, skip_padding=True)
     if args.config:
         config_path = args.config
     else:
@@ -96,7 +53,8 @@ def pack(args: argparse.Namespace):
     else:
         outfile = imagefile.filename.stem + '.tgr'
     
-    data = b''
+    # Frames are appended to one growing buffer
+    data = bytearray()
     for frame_index in range(0,len(imagefile.img_data)):
         if frame_index in imagefile.padding_frames:
             imagefile.frameoffsets.append(0)
@@ -110,6 +68,12 @@ def pack(args: argparse.Namespace):
     with open(outfile ,'wb') as fh_out:
         fh_out.write(data)
 
+def run(args: argparse.Namespace):
+    if args.profile:
+        tgrlib.run_profiled(args.func, args)
+    else:
+        args.func(args)
+
 # from https://stackoverflow.com/a/34256516
 # Allows filepaths with spaces to be parsed correctly
 class MyAction(argparse.Action):
@@ -119,6 +83,7 @@ class MyAction(argparse.Action):
 
 ## Define parsers
 main_parse = argparse.ArgumentParser(prog="tgrtool")
+main_parse.add_argument('--profile', action='store_true', help='profile the command and print the functions it spent the most time in. Only the main thread is profiled, so PNG compression during unpack shows as waiting on saves')
 
 sub_parsers = main_parse.add_subparsers(required=True, help="available commands")
 
@@ -131,6 +96,7 @@ unpack_parse.add_argument('--single-frame', default=-1, type=int, help='extract
 unpack_parse.add_argument('--fx-error-fix', action='store_true', help='use this if non-unit .TGR files have multicolored horizontal stripes in the output')
 unpack_parse.add_argument('-o', '--output', type=str, default=None, help='destination directory for unpacked files')
 unpack_parse.add_argument('--config', type=str, help="path to write sprite config file")
+unpack_parse.add_argument('--compress-level', choices=range(0,10), default=1, type=int, help='png compression level for extracted frames, from 0 (none) to 9 (smallest). Defaults to 1 (fastest)')
 unpack_parse.add_argument('source', type=str, help='path to target tgr file', nargs='+', action=MyAction)
 
 pack_parse = sub_parsers.add_parser("pack")
@@ -154,9 +120,9 @@ if __name__ == '__main__':
                 break
             try:              
                 args = main_parse.parse_args(command.split(' '))
-                args.func(args)
+                run(args)
             except SystemExit:
                 print('')
     else:
         args = main_parse.parse_args()
-        args.func(args)
+        run(args)